@@ -8,8 +8,9 @@ from pathlib import Path
 
 from .arg_example import parser
 from .main import main
+from .token_store import TokenRecord, TokenStore
 
 with open(Path(__file__).parent / "service_config.json", encoding="utf-8") as file:
     service_config: Dict[str, Dict[str, str]] = json.load(file)
 
-__all__: List[str] = ["service_config", "parser", "main"]
+__all__: List[str] = ["service_config", "parser", "main", "TokenRecord", "TokenStore"]
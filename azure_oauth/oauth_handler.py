@@ -13,9 +13,9 @@ from flask import request as req, Flask, redirect
 
 from helpers import (  # type: ignore
     create_random_string,
-    get_many,
     handle_response,
 )
+from token_store import TokenRecord  # type: ignore
 
 with open(Path(__file__).parent / "service_config.json", encoding="utf-8") as file:
     service_config: Dict[str, Dict[str, str]] = json.load(file)
@@ -40,6 +40,8 @@ class OAuth2:
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
+        self.service = service
+        self.token: Optional[TokenRecord] = None
 
         service_info = self.get_service_info(service)
         self.authorization_url = service_info[0]
@@ -178,7 +180,10 @@ class OAuth2:
         if result is None:
             return None
 
-        access_token = get_many(result, ["access_token"])
+        access_token = None
+        if isinstance(result, dict):
+            access_token = result.get("access_token")
+            self.token = TokenRecord.from_response(self.service, self.scopes, result)
 
         print(json.dumps(result, indent=4))
 
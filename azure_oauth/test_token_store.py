@@ -0,0 +1,245 @@
+# test_token_store.py
+
+"""Tests for the compact token record and its binary snapshot format."""
+
+import io
+import os
+import stat
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+from token_store import NEVER_EXPIRES, TokenRecord, TokenStore  # type: ignore
+
+try:
+    from oauth_handler import OAuth2  # type: ignore
+except ImportError:
+    OAuth2 = None
+
+
+def make_store() -> TokenStore:
+    """Builds a small store with one expired, one valid and one non-expiring token."""
+
+    store = TokenStore()
+    store.add("tenant-a", TokenRecord("azure", "vso.code", "expired", 10, "refresh"))
+    store.add("tenant-b", TokenRecord("azure", "vso.code", "valid", 100))
+    store.add(
+        "tenant-c",
+        TokenRecord("github", "repo", "forever", NEVER_EXPIRES, None, "bearer"),
+    )
+
+    return store
+
+
+class TokenRecordTest(unittest.TestCase):
+    """Tests for TokenRecord."""
+
+    def test_from_response_with_expiry(self):
+        record = TokenRecord.from_response(
+            "azure", "vso.code", {"access_token": "a", "expires_in": 60}, now=5
+        )
+
+        self.assertEqual(record.expires_at, 65)
+        self.assertEqual(record.scope, "vso.code")
+        self.assertTrue(record.is_expired(65))
+
+    def test_from_response_without_expiry_never_expires(self):
+        record = TokenRecord.from_response("github", None, {"access_token": "a"}, now=5)
+
+        self.assertEqual(record.expires_at, NEVER_EXPIRES)
+        self.assertFalse(record.is_expired(NEVER_EXPIRES))
+
+    def test_from_response_rejects_non_mapping(self):
+        for response in (["access_token"], "token", 3, None, {}):
+            self.assertIsNone(TokenRecord.from_response("azure", None, response))
+
+    def test_from_response_parses_numeric_expiry(self):
+        for expires_in in ("3599.5", 3599.5, "3599", 3599):
+            record = TokenRecord.from_response(
+                "azure", None, {"access_token": "a", "expires_in": expires_in}, now=1
+            )
+            self.assertEqual(record.expires_at, 3600)
+
+    def test_from_response_rejects_malformed_expiry(self):
+        for expires_in in ("soon", "nan", "inf", [60], True, 1e400):
+            response = {"access_token": "a", "expires_in": expires_in}
+            self.assertIsNone(TokenRecord.from_response("azure", None, response))
+
+    def test_from_response_clamps_out_of_range_expiry(self):
+        late = {"access_token": "a", "expires_in": 10**30}
+        early = {"access_token": "a", "expires_in": -100}
+
+        self.assertEqual(
+            TokenRecord.from_response("x", None, late, now=0).expires_at,
+            NEVER_EXPIRES,
+        )
+        self.assertEqual(
+            TokenRecord.from_response("x", None, early, now=5).expires_at, 0
+        )
+
+    def test_from_response_rejects_non_str_fields(self):
+        for field, value in (
+            ("access_token", 123),
+            ("refresh_token", 123),
+            ("token_type", ["Bearer"]),
+            ("scope", {"a": "b"}),
+            ("scope", ["a", 1]),
+        ):
+            response = {"access_token": "a", field: value}
+            self.assertIsNone(TokenRecord.from_response("azure", None, response))
+
+    def test_from_response_joins_list_scope(self):
+        response = {"access_token": "a", "scope": ["read", "write"]}
+
+        self.assertEqual(
+            TokenRecord.from_response("azure", None, response).scope, "read write"
+        )
+
+    def test_constructor_rejects_out_of_range_expiry(self):
+        for expires_at in (-1, NEVER_EXPIRES + 1):
+            with self.assertRaises(ValueError):
+                TokenRecord("azure", "scope", "a", expires_at)
+
+
+class TokenStoreTest(unittest.TestCase):
+    """Tests for TokenStore scans and snapshots."""
+
+    def test_expired_skips_never_expiring_tokens(self):
+        self.assertEqual(make_store().expired(now=50), [0])
+
+    def test_purge_expired_compacts_rows(self):
+        store = make_store()
+
+        self.assertEqual(store.purge_expired(now=500), 2)
+        self.assertEqual([record.access_token for record in store], ["forever"])
+        self.assertEqual(store.get(0).service, "github")
+
+    def test_purge_expired_keeps_keys_in_sync(self):
+        store = make_store()
+        store.purge_expired(now=50)
+
+        self.assertNotIn("tenant-a", store)
+        self.assertIsNone(store.find("tenant-a"))
+        self.assertEqual(store.find("tenant-b"), 0)
+        self.assertEqual(store.key(1), "tenant-c")
+        self.assertEqual(store.get_by_key("tenant-c").access_token, "forever")
+
+    def test_purge_expired_drops_unused_strings(self):
+        store = make_store()
+        store.purge_expired(now=500)
+
+        self.assertEqual(sorted(store._strings), ["bearer", "github", "repo"])
+        restored = TokenStore.from_bytes(store.to_bytes())
+        self.assertEqual(restored._strings, store._strings)
+
+    def test_add_replaces_token_with_same_key(self):
+        store = make_store()
+        row = store.add("tenant-b", TokenRecord("azure", "vso.code", "newer", 200))
+
+        self.assertEqual(row, 1)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get_by_key("tenant-b").access_token, "newer")
+
+    def test_rejected_add_leaves_store_untouched(self):
+        store = make_store()
+        before = store.to_bytes()
+
+        record = TokenRecord("azure", "scope", "a", 10)
+        record.expires_at = 10**30
+        with self.assertRaises(ValueError):
+            store.add("tenant-d", record)
+
+        record.expires_at, record.access_token = 10, 123
+        with self.assertRaises(TypeError):
+            store.add("tenant-d", record)
+
+        self.assertEqual(store.to_bytes(), before)
+        self.assertNotIn("tenant-d", store)
+
+    def test_round_trip(self):
+        store = make_store()
+        restored = TokenStore.from_bytes(store.to_bytes())
+
+        self.assertEqual(list(restored), list(store))
+        self.assertEqual(restored.find("tenant-c"), 2)
+        self.assertEqual(restored.get(0).refresh_token, "refresh")
+        self.assertIsNone(restored.get(1).refresh_token)
+
+    def test_truncated_snapshot_is_rejected(self):
+        data = make_store().to_bytes()
+
+        for length in range(len(data)):
+            with self.assertRaises(ValueError):
+                TokenStore.from_bytes(data[:length])
+
+    def test_trailing_data_is_rejected(self):
+        with self.assertRaises(ValueError):
+            TokenStore.from_bytes(make_store().to_bytes() + b"\x00")
+
+    def test_out_of_range_string_id_is_rejected(self):
+        data = bytearray(make_store().to_bytes())
+        # The service id column starts right after the three string sections.
+        offset = len(data) - 3 * 8 - 3 * 3 * 4
+        data[offset : offset + 4] = (99).to_bytes(4, "little")
+
+        with self.assertRaises(ValueError):
+            TokenStore.from_bytes(bytes(data))
+
+    def test_duplicate_keys_are_rejected(self):
+        data = make_store().to_bytes().replace(b"tenant-b", b"tenant-a")
+
+        with self.assertRaises(ValueError):
+            TokenStore.from_bytes(data)
+
+    def test_bad_magic_is_rejected(self):
+        with self.assertRaises(ValueError):
+            TokenStore.from_bytes(b"NOPE" + make_store().to_bytes()[4:])
+
+    def test_save_is_owner_only(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "tokens.bin"
+            make_store().save(path)
+
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+            self.assertEqual(os.listdir(folder), ["tokens.bin"])
+            self.assertEqual(list(TokenStore.load(path)), list(make_store()))
+
+
+@unittest.skipIf(OAuth2 is None, "oauth_handler dependencies are not installed")
+class AuthenticateTest(unittest.TestCase):
+    """Tests for the token record kept by OAuth2.authenticate."""
+
+    def authenticate(self, result):
+        app = OAuth2("github", "http://localhost", "id", "secret", "repo")
+
+        authorize = mock.patch.object(OAuth2, "authorize", return_value=True)
+        get_token = mock.patch.object(OAuth2, "_get_access_token", return_value=result)
+
+        with authorize, get_token, redirect_stdout(io.StringIO()):
+            access_token = app.authenticate()
+
+        return app, access_token
+
+    def test_keeps_token_record(self):
+        app, access_token = self.authenticate({"access_token": "a"})
+
+        self.assertEqual(access_token, "a")
+        self.assertEqual(app.token.service, "github")
+        self.assertEqual(app.token.scope, "repo")
+        self.assertFalse(app.token.is_expired())
+
+    def test_unusable_responses_do_not_raise(self):
+        for result in (
+            "token",
+            ["access_token"],
+            {"access_token": "a", "scope": ["repo", 1]},
+            {"access_token": 123},
+        ):
+            app, _ = self.authenticate(result)
+            self.assertIsNone(app.token)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,679 @@
+# token_store.py
+
+"""Compact in-memory representation of OAuth2 tokens.
+
+TokenRecord holds a single token with interned identifiers and an integer
+epoch expiry. TokenStore keeps many tokens in array-backed columns so that
+expiry scans and snapshots do not touch one Python object per token.
+"""
+
+import os
+import sys
+import time
+import struct
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+MAGIC = b"AZTK"
+VERSION = 2
+
+_HEADER = struct.Struct("<4sBII")  # magic, version, string count, row count
+_LENGTH = struct.Struct("<I")
+
+# Snapshot columns are fixed width: 4-byte ids and lengths, 8-byte expiries.
+_ID_TYPECODES = [code for code in "IL" if array(code).itemsize == _LENGTH.size]
+if not _ID_TYPECODES:
+    raise RuntimeError("No 4-byte unsigned array type is available.")
+_ID_TYPECODE = _ID_TYPECODES[0]
+
+_EXPIRY_TYPECODE = "q"
+if array(_EXPIRY_TYPECODE).itemsize != 8:
+    raise RuntimeError("No 8-byte signed array type is available.")
+
+# Expiry stored for tokens issued without an expires_in, e.g. GitHub and Slack.
+NEVER_EXPIRES = 2**63 - 1
+
+
+def _to_little_endian(column: array) -> bytes:
+    """Returns the raw bytes of an array in little-endian order."""
+
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+
+    return column.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    """Builds an array from little-endian raw bytes."""
+
+    column = array(typecode)
+    column.frombytes(data)
+
+    if sys.byteorder == "big":
+        column.byteswap()
+
+    return column
+
+
+def _check_record(record: "TokenRecord") -> None:
+    """Checks that a record can be stored in a TokenStore column.
+
+    Raises:
+        TypeError: If a field has the wrong type.
+        ValueError: If the expiry is outside 0 to NEVER_EXPIRES.
+    """
+
+    for name in ("service", "scope", "token_type", "access_token"):
+        if not isinstance(getattr(record, name), str):
+            raise TypeError(f"Token {name} must be a string.")
+
+    if record.refresh_token is not None and not isinstance(record.refresh_token, str):
+        raise TypeError("Token refresh_token must be a string or None.")
+
+    if isinstance(record.expires_at, bool) or not isinstance(record.expires_at, int):
+        raise TypeError("Token expires_at must be an integer.")
+
+    if not 0 <= record.expires_at <= NEVER_EXPIRES:
+        raise ValueError(f"Token expires_at is outside 0 to {NEVER_EXPIRES}.")
+
+
+class TokenRecord:
+    """A single access token with interned identifiers."""
+
+    __slots__ = (
+        "service",
+        "scope",
+        "token_type",
+        "access_token",
+        "refresh_token",
+        "expires_at",
+    )
+
+    def __init__(
+        self,
+        service: str,
+        scope: str,
+        access_token: str,
+        expires_at: int,
+        refresh_token: Optional[str] = None,
+        token_type: str = "Bearer",
+    ):
+        self.service = sys.intern(service)
+        self.scope = sys.intern(scope)
+        self.token_type = sys.intern(token_type)
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = int(expires_at)
+
+        _check_record(self)
+
+    def __repr__(self) -> str:
+        return (
+            f"TokenRecord(service={self.service!r}, scope={self.scope!r}, "
+            f"expires_at={self.expires_at})"
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TokenRecord):
+            return NotImplemented
+
+        return all(
+            getattr(self, slot) == getattr(other, slot) for slot in self.__slots__
+        )
+
+    @classmethod
+    def from_response(
+        cls,
+        service: Optional[str],
+        scopes: Optional[str],
+        response: Any,
+        now: Optional[int] = None,
+    ) -> Optional["TokenRecord"]:
+        """Builds a record from a token endpoint JSON response.
+
+        Args:
+            service (Optional[str]): The service the token was issued by.
+            scopes (Optional[str]): The requested scopes, used when the response has none.
+            response (Any): The decoded token endpoint response.
+            now (Optional[int], optional): The current epoch time. Defaults to None.
+
+        Returns:
+            Optional[TokenRecord]: The record, or None if the response is not a
+                mapping, has no access token or has a field of the wrong type.
+                Tokens without an expires_in never expire.
+        """
+
+        if not isinstance(response, dict):
+            return None
+
+        access_token = response.get("access_token")
+        if not access_token or not isinstance(access_token, str):
+            return None
+
+        refresh_token = response.get("refresh_token")
+        if refresh_token is not None and not isinstance(refresh_token, str):
+            return None
+
+        token_type = response.get("token_type") or "Bearer"
+        if not isinstance(token_type, str):
+            return None
+
+        scope = response.get("scope") or scopes or ""
+        if isinstance(scope, (list, tuple)) and all(
+            isinstance(item, str) for item in scope
+        ):
+            scope = " ".join(scope)
+        if not isinstance(scope, str):
+            return None
+
+        if now is None:
+            now = int(time.time())
+
+        expires_in = response.get("expires_in")
+        if expires_in is None:
+            expires_at = NEVER_EXPIRES
+        elif isinstance(expires_in, bool):
+            return None
+        else:
+            try:
+                expires_at = now + int(float(expires_in))
+            except (TypeError, ValueError, OverflowError):
+                return None
+            expires_at = min(max(expires_at, 0), NEVER_EXPIRES)
+
+        return cls(
+            service=service or "",
+            scope=scope,
+            access_token=access_token,
+            expires_at=expires_at,
+            refresh_token=refresh_token,
+            token_type=token_type,
+        )
+
+    def is_expired(self, now: Optional[int] = None) -> bool:
+        """Checks whether the token has expired.
+
+        Args:
+            now (Optional[int], optional): The current epoch time. Defaults to None.
+
+        Returns:
+            bool: True if the token has expired, never for NEVER_EXPIRES.
+        """
+
+        if self.expires_at == NEVER_EXPIRES:
+            return False
+
+        return self.expires_at <= (int(time.time()) if now is None else now)
+
+
+class TokenStore:
+    """Column-oriented store for large numbers of tokens.
+
+    Every token is stored under a unique key, such as a tenant id. Services,
+    scopes and token types are kept once in a shared string table and
+    referenced by index, expiries live in a single array of 64-bit ints.
+
+    Row numbers are only stable until the next purge_expired call, look tokens
+    up by key to keep a lasting reference.
+    """
+
+    def __init__(self) -> None:
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+        self._service_ids = array(_ID_TYPECODE)
+        self._scope_ids = array(_ID_TYPECODE)
+        self._type_ids = array(_ID_TYPECODE)
+        self._expires_at = array(_EXPIRY_TYPECODE)
+
+        self._access_tokens: List[str] = []
+        self._refresh_tokens: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._expires_at)
+
+    def __iter__(self) -> Iterator[TokenRecord]:
+        for row in range(len(self)):
+            yield self.get(row)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._rows
+
+    def _intern(self, value: str) -> int:
+        """Returns the string table index for a value, adding it if needed."""
+
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(sys.intern(value))
+            self._string_ids[value] = string_id
+
+        return string_id
+
+    def add(self, key: str, record: TokenRecord) -> int:
+        """Adds a token to the store, replacing any token with the same key.
+
+        The record is checked before any column changes, so a rejected record
+        leaves the store untouched.
+
+        Args:
+            key (str): The unique key of the token, e.g. a tenant id.
+            record (TokenRecord): The token to add.
+
+        Raises:
+            TypeError: If the key or a record field has the wrong type.
+            ValueError: If the record expiry is outside 0 to NEVER_EXPIRES.
+
+        Returns:
+            int: The current row of the stored token.
+        """
+
+        if not isinstance(key, str):
+            raise TypeError("Token key must be a string.")
+
+        _check_record(record)
+
+        service_id = self._intern(record.service)
+        scope_id = self._intern(record.scope)
+        type_id = self._intern(record.token_type)
+        refresh_token = record.refresh_token or ""
+
+        row = self._rows.get(key)
+        if row is not None:
+            self._service_ids[row] = service_id
+            self._scope_ids[row] = scope_id
+            self._type_ids[row] = type_id
+            self._expires_at[row] = record.expires_at
+            self._access_tokens[row] = record.access_token
+            self._refresh_tokens[row] = refresh_token
+            return row
+
+        row = len(self)
+        self._service_ids.append(service_id)
+        self._scope_ids.append(scope_id)
+        self._type_ids.append(type_id)
+        self._expires_at.append(record.expires_at)
+        self._access_tokens.append(record.access_token)
+        self._refresh_tokens.append(refresh_token)
+        self._keys.append(key)
+        self._rows[key] = row
+
+        return row
+
+    def find(self, key: str) -> Optional[int]:
+        """Finds the current row of a token.
+
+        Args:
+            key (str): The key the token was added under.
+
+        Returns:
+            Optional[int]: The row, or None if no token has the key.
+        """
+
+        return self._rows.get(key)
+
+    def get(self, row: int) -> TokenRecord:
+        """Returns the token stored at a row.
+
+        Rows change when purge_expired compacts the store.
+
+        Args:
+            row (int): The row of the token.
+
+        Returns:
+            TokenRecord: The stored token.
+        """
+
+        return TokenRecord(
+            service=self._strings[self._service_ids[row]],
+            scope=self._strings[self._scope_ids[row]],
+            access_token=self._access_tokens[row],
+            expires_at=self._expires_at[row],
+            refresh_token=self._refresh_tokens[row] or None,
+            token_type=self._strings[self._type_ids[row]],
+        )
+
+    def get_by_key(self, key: str) -> Optional[TokenRecord]:
+        """Returns the token stored under a key.
+
+        Args:
+            key (str): The key the token was added under.
+
+        Returns:
+            Optional[TokenRecord]: The stored token, or None if no token has the key.
+        """
+
+        row = self._rows.get(key)
+
+        return None if row is None else self.get(row)
+
+    def key(self, row: int) -> str:
+        """Returns the key of the token stored at a row.
+
+        Args:
+            row (int): The row of the token.
+
+        Returns:
+            str: The key of the token.
+        """
+
+        return self._keys[row]
+
+    def expired(self, now: Optional[int] = None) -> List[int]:
+        """Finds the rows of all expired tokens, skipping NEVER_EXPIRES ones.
+
+        Args:
+            now (Optional[int], optional): The current epoch time. Defaults to None.
+
+        Returns:
+            List[int]: The rows of the expired tokens, valid until the next purge.
+        """
+
+        if now is None:
+            now = int(time.time())
+
+        return [
+            row
+            for row, expiry in enumerate(self._expires_at)
+            if expiry <= now and expiry != NEVER_EXPIRES
+        ]
+
+    def purge_expired(self, now: Optional[int] = None) -> int:
+        """Removes all expired tokens, compacting the remaining rows.
+
+        Tokens stored with NEVER_EXPIRES are always kept. The rows of the
+        remaining tokens change, and strings no longer used by any token are
+        dropped from the string table.
+
+        Args:
+            now (Optional[int], optional): The current epoch time. Defaults to None.
+
+        Returns:
+            int: The number of tokens removed.
+        """
+
+        if now is None:
+            now = int(time.time())
+
+        keep = [
+            row
+            for row, expiry in enumerate(self._expires_at)
+            if expiry > now or expiry == NEVER_EXPIRES
+        ]
+        removed = len(self) - len(keep)
+
+        strings = self._strings
+        self._strings = []
+        self._string_ids = {}
+
+        for name in ("_service_ids", "_scope_ids", "_type_ids"):
+            column = getattr(self, name)
+            setattr(
+                self,
+                name,
+                array(
+                    _ID_TYPECODE,
+                    (self._intern(strings[column[row]]) for row in keep),
+                ),
+            )
+
+        self._expires_at = array(
+            _EXPIRY_TYPECODE, (self._expires_at[row] for row in keep)
+        )
+        self._access_tokens = [self._access_tokens[row] for row in keep]
+        self._refresh_tokens = [self._refresh_tokens[row] for row in keep]
+        self._keys = [self._keys[row] for row in keep]
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+
+        return removed
+
+    @staticmethod
+    def _pack_strings(values: List[str]) -> Tuple[bytes, bytes]:
+        """Encodes strings as a length column followed by one joined blob."""
+
+        encoded = [value.encode("utf-8") for value in values]
+        lengths = array(_ID_TYPECODE, (len(value) for value in encoded))
+
+        return _to_little_endian(lengths), b"".join(encoded)
+
+    @staticmethod
+    def _unpack_strings(
+        data: Union[bytes, memoryview], offset: int, count: int
+    ) -> Tuple[List[str], int]:
+        """Decodes strings written by _pack_strings, returning the new offset."""
+
+        end = offset + count * _LENGTH.size
+        if end > len(data):
+            raise ValueError("Token snapshot is truncated.")
+
+        lengths = _from_little_endian(_ID_TYPECODE, bytes(data[offset:end]))
+        offset = end
+
+        if offset + sum(lengths) > len(data):
+            raise ValueError("Token snapshot is truncated.")
+
+        values: List[str] = []
+        for length in lengths:
+            values.append(str(data[offset : offset + length], "utf-8"))
+            offset += length
+
+        return values, offset
+
+    def to_bytes(self) -> bytes:
+        """Serializes the store to a compact binary snapshot.
+
+        Returns:
+            bytes: The snapshot.
+        """
+
+        parts = [_HEADER.pack(MAGIC, VERSION, len(self._strings), len(self))]
+
+        for values in (
+            self._strings,
+            self._keys,
+            self._access_tokens,
+            self._refresh_tokens,
+        ):
+            lengths, blob = self._pack_strings(values)
+            parts.extend((lengths, blob))
+
+        for column in (
+            self._service_ids,
+            self._scope_ids,
+            self._type_ids,
+            self._expires_at,
+        ):
+            parts.append(_to_little_endian(column))
+
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TokenStore":
+        """Restores a store from a binary snapshot.
+
+        Args:
+            data (bytes): The snapshot produced by to_bytes.
+
+        Raises:
+            ValueError: If the snapshot is not a valid token store snapshot.
+
+        Returns:
+            TokenStore: The restored store.
+        """
+
+        try:
+            magic, version, string_count, row_count = _HEADER.unpack_from(data)
+        except struct.error as exc:
+            raise ValueError("Token snapshot is truncated.") from exc
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Data is not a supported token snapshot.")
+
+        view = memoryview(data)
+        offset = _HEADER.size
+        store = cls()
+
+        try:
+            columns: List[List[str]] = []
+            for count in (string_count, row_count, row_count, row_count):
+                values, offset = cls._unpack_strings(view, offset, count)
+                columns.append(values)
+
+            for name, typecode in (
+                ("_service_ids", _ID_TYPECODE),
+                ("_scope_ids", _ID_TYPECODE),
+                ("_type_ids", _ID_TYPECODE),
+                ("_expires_at", _EXPIRY_TYPECODE),
+            ):
+                end = offset + row_count * array(typecode).itemsize
+                if end > len(view):
+                    raise ValueError("Token snapshot is truncated.")
+                column = _from_little_endian(typecode, bytes(view[offset:end]))
+                if typecode == _ID_TYPECODE and column and max(column) >= string_count:
+                    raise ValueError("Token snapshot is corrupt.")
+                if typecode == _EXPIRY_TYPECODE and column and min(column) < 0:
+                    raise ValueError("Token snapshot is corrupt.")
+                setattr(store, name, column)
+                offset = end
+        except UnicodeDecodeError as exc:
+            raise ValueError("Token snapshot is corrupt.") from exc
+
+        if offset != len(view):
+            raise ValueError("Token snapshot has trailing data.")
+
+        strings, store._keys, store._access_tokens, store._refresh_tokens = columns
+        store._strings = [sys.intern(value) for value in strings]
+        store._string_ids = {value: index for index, value in enumerate(store._strings)}
+        store._rows = {key: row for row, key in enumerate(store._keys)}
+
+        if len(store._string_ids) != string_count or len(store._rows) != row_count:
+            raise ValueError("Token snapshot has duplicate entries.")
+
+        return store
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Writes a binary snapshot of the store to disk.
+
+        The snapshot contains access and refresh tokens in plaintext, so it is
+        written owner-only (0600) through a private temporary file and
+        atomically replaces any previous snapshot.
+
+        Args:
+            path (Union[str, Path]): The snapshot file path.
+        """
+
+        path = Path(path)
+        file_descriptor, temp_name = tempfile.mkstemp(
+            prefix=f".{path.name}.", suffix=".tmp", dir=path.parent
+        )
+
+        try:
+            with os.fdopen(file_descriptor, "wb") as snapshot:
+                snapshot.write(self.to_bytes())
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(temp_name, path)
+        except BaseException:
+            try:
+                os.unlink(temp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "TokenStore":
+        """Reads a binary snapshot of a store from disk.
+
+        Args:
+            path (Union[str, Path]): The snapshot file path.
+
+        Returns:
+            TokenStore: The restored store.
+        """
+
+        return cls.from_bytes(Path(path).read_bytes())
+
+
+def benchmark(count: int = 100_000) -> Dict[str, float]:
+    """Measures memory per token and snapshot load time.
+
+    Args:
+        count (int, optional): The number of tokens to generate. Defaults to 100_000.
+
+    Returns:
+        Dict[str, float]: The measured figures.
+    """
+
+    import json
+    import tracemalloc
+
+    now = int(time.time())
+    services = ["azure", "microsoft_graph", "google", "github"]
+    scopes = ["vso.code vso.work", "User.Read", "openid email", "repo"]
+
+    def response(index: int) -> Dict:
+        return {
+            "access_token": f"{index:064x}",
+            "refresh_token": f"{index:048x}",
+            "token_type": "Bearer",
+            "expires_in": 3600 - index % 7200,
+            "scope": scopes[index % len(scopes)],
+        }
+
+    tracemalloc.start()
+    dicts = {
+        f"tenant-{index}": json.loads(json.dumps(response(index)))
+        for index in range(count)
+    }
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    del dicts
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = TokenStore()
+    for index in range(count):
+        record = TokenRecord.from_response(
+            services[index % len(services)], None, response(index), now
+        )
+        if record is not None:
+            store.add(f"tenant-{index}", record)
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "tokens.bin"
+        start = time.perf_counter()
+        store.save(path)
+        save_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        restored = TokenStore.load(path)
+        load_seconds = time.perf_counter() - start
+        snapshot_bytes = path.stat().st_size
+
+    start = time.perf_counter()
+    expired = restored.expired(now)
+    scan_seconds = time.perf_counter() - start
+
+    return {
+        "tokens": float(count),
+        "dict_bytes_per_token": dict_bytes / count,
+        "store_bytes_per_token": store_bytes / count,
+        "snapshot_bytes_per_token": snapshot_bytes / count,
+        "save_seconds": save_seconds,
+        "load_seconds": load_seconds,
+        "expiry_scan_seconds": scan_seconds,
+        "expired_tokens": float(len(expired)),
+    }
+
+
+if __name__ == "__main__":
+    results = benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
+    for name, value in results.items():
+        print(f"{name}: {value:,.6f}")